@@ -3,61 +3,121 @@
 # - If client requests Accept: text/event-stream the endpoint will stream SSE chunks.
 
 import os
+import atexit
 import asyncio
 from typing import AsyncIterator
 
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
+import numpy as np
+import orjson
+
 # Use the official genai client (from google-genai package)
 from google import genai
+from google.genai import types
 
 # NEW imports for logging
-import json
-from datetime import datetime
+import hashlib
+import time
+import threading
+from collections import OrderedDict
 from pathlib import Path
 
 # Load environment variables from .env (if present)
 load_dotenv()
 
-app = FastAPI()
+# orjson is several times faster than stdlib json; use it for responses too
+app = FastAPI(default_response_class=ORJSONResponse)
 
-# ---- Simple JSON "store" for conversation history ----
-DATA_FILE = Path(__file__).with_name("conversations.json")
+# The second-resolution prefix of a timestamp only changes once a second, so
+# cache it and append the microsecond part; this avoids allocating a datetime
+# object per log record (datetime.utcnow() is also deprecated since 3.12).
+# Fire-and-forget tasks must be referenced somewhere or the event loop may
+# garbage-collect them mid-flight; park them in a set until they finish
+_BG_TASKS: set = set()
 
 
-def append_to_conversations(user_message: str, assistant_reply: str) -> None:
+def _spawn_bg(coro) -> None:
+    task = asyncio.create_task(coro)
+    _BG_TASKS.add(task)
+    task.add_done_callback(_BG_TASKS.discard)
+
+
+_TS_CACHE = (0, "")
+
+
+def _utc_timestamp() -> str:
+    global _TS_CACHE
+    now = time.time()
+    secs = int(now)
+    cached_secs, prefix = _TS_CACHE
+    if secs != cached_secs:
+        prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(secs))
+        _TS_CACHE = (secs, prefix)
+    return f"{prefix}.{int((now - secs) * 1_000_000):06d}"
+
+# ---- Simple JSONL "store" for conversation history ----
+# One JSON object per line so each chat turn is a single append instead of a
+# full read-parse-rewrite of the whole history.
+DATA_FILE = Path(__file__).with_name("conversations.jsonl")
+_LEGACY_DATA_FILE = Path(__file__).with_name("conversations.json")
+_DATA_LOCK = threading.Lock()
+
+
+def _migrate_conversations() -> None:
     """
-    Append a single user/assistant exchange to conversations.json.
-    File format: list of {timestamp, user, assistant}
+    One-shot migration of the old JSON-array store to JSONL. Runs at import
+    in every worker, so it must tolerate racing siblings: the JSONL is
+    written to a per-process temp file and renamed into place atomically,
+    and the legacy file may already be gone by the time we delete it.
     """
+    if not _LEGACY_DATA_FILE.exists() or DATA_FILE.exists():
+        return
     try:
-        if DATA_FILE.exists():
-            data = json.loads(DATA_FILE.read_text(encoding="utf-8"))
-        else:
-            data = []
+        records = orjson.loads(_LEGACY_DATA_FILE.read_bytes())
     except Exception:
-        # if file is corrupted, start fresh
-        data = []
-
-    data.append(
-        {
-            "timestamp": datetime.utcnow().isoformat(),
-            "user": user_message,
-            "assistant": assistant_reply,
-        }
-    )
+        # if the old file is corrupted, start fresh
+        records = []
+    tmp = DATA_FILE.with_name(f"{DATA_FILE.name}.{os.getpid()}.tmp")
+    with tmp.open("wb") as f:
+        for record in records:
+            f.write(orjson.dumps(record) + b"\n")
+    tmp.replace(DATA_FILE)
+    _LEGACY_DATA_FILE.unlink(missing_ok=True)
+
+
+_migrate_conversations()
+
+
+def append_to_conversations(user_message: str, assistant_reply: str) -> None:
+    """
+    Append a single user/assistant exchange to conversations.jsonl.
+    File format: one {timestamp, user, assistant} object per line.
+    """
+    record = {
+        "timestamp": _utc_timestamp(),
+        "user": user_message,
+        "assistant": assistant_reply,
+    }
+    with _DATA_LOCK:
+        with DATA_FILE.open("ab") as f:
+            f.write(orjson.dumps(record) + b"\n")
 
-    DATA_FILE.write_text(
-        json.dumps(data, indent=2, ensure_ascii=False),
-        encoding="utf-8",
-    )
+
+def load_conversations() -> list:
+    """Read the full history back as a list of records."""
+    if not DATA_FILE.exists():
+        return []
+    with DATA_FILE.open("rb") as f:
+        return [orjson.loads(line) for line in f if line.strip()]
 
 
 class ChatRequest(BaseModel):
     message: str
+    no_cache: bool = False
 
 
 # Initialize Gemini client
@@ -77,74 +137,472 @@ if not GENAI_API_KEY:
 # Default model (change if you want a different one)
 GENIE_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
 
+# Reject outsized prompts before they tie up a threadpool slot and the API
+# budget for seconds at a time
+MAX_PROMPT_CHARS = int(os.getenv("MAX_PROMPT_CHARS", "32000"))
+
 client = genai.Client(api_key=GENAI_API_KEY)
 
+# ---- Optional explicit context caching for a static system prefix ----
+# Gemini bills cached input tokens at a large discount, so if a SYSTEM_PROMPT
+# is configured and long enough to qualify (the API enforces a ~2,048-token
+# minimum, approximated here in chars) we upload it once and reference it by
+# name instead of resending it with every request.
+SYSTEM_PROMPT = os.getenv("SYSTEM_PROMPT", "")
+CACHE_TTL_SECONDS = 3600
+_MIN_CACHE_CHARS = 2048 * 4  # rough chars-per-token estimate
+_CACHED_CONTENT_NAME = None
+
+
+def _create_context_cache():
+    if len(SYSTEM_PROMPT) < _MIN_CACHE_CHARS:
+        return None
+    try:
+        cache = client.caches.create(
+            model=GENIE_MODEL,
+            config={
+                "contents": [SYSTEM_PROMPT],
+                "ttl": f"{CACHE_TTL_SECONDS}s",
+            },
+        )
+        return cache.name
+    except Exception:
+        # caching is only an optimization; fall back to inlining the prefix
+        return None
+
+
+async def _refresh_context_cache() -> None:
+    # Bump the TTL before it lapses so long-running servers keep the discount
+    while True:
+        await asyncio.sleep(CACHE_TTL_SECONDS * 0.8)
+        try:
+            await asyncio.to_thread(
+                client.caches.update,
+                name=_CACHED_CONTENT_NAME,
+                config={"ttl": f"{CACHE_TTL_SECONDS}s"},
+            )
+        except Exception:
+            pass
+
+
+@app.on_event("startup")
+async def _init_context_cache() -> None:
+    global _CACHED_CONTENT_NAME
+    _CACHED_CONTENT_NAME = await asyncio.to_thread(_create_context_cache)
+    if _CACHED_CONTENT_NAME:
+        _spawn_bg(_refresh_context_cache())
+
 # NEW: helper to append exchanges to a JSONL logfile
 LOG_DIR = Path(__file__).parent / "logs"
 LOG_FILE = LOG_DIR / "exchanges.jsonl"
 
+# Keep one long-lived append handle instead of open/write/close per exchange;
+# the open+close syscall pair costs far more than the write itself.
+LOG_DIR.mkdir(parents=True, exist_ok=True)
+_LOG_FH = LOG_FILE.open("ab", buffering=1 << 16)
+_LOG_LOCK = threading.Lock()
+atexit.register(_LOG_FH.close)
+
+# All log writes funnel through one background task draining a bounded
+# queue, so request handlers only pay for an enqueue. Records are batched
+# into a single writelines() call; on overflow the oldest record is dropped.
+LOG_QUEUE_MAXSIZE = 10_000
+LOG_BATCH_MAX = 64
+LOG_BATCH_WINDOW = 0.05
+LOG_QUEUE = None  # created on startup so it binds to the running loop
+
+
+def _write_log_lines(lines) -> None:
+    with _LOG_LOCK:
+        _LOG_FH.writelines(lines)
+        _LOG_FH.flush()
+
+
+async def _log_writer() -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        lines = [await LOG_QUEUE.get()]
+        deadline = loop.time() + LOG_BATCH_WINDOW
+        while len(lines) < LOG_BATCH_MAX:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                lines.append(await asyncio.wait_for(LOG_QUEUE.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        try:
+            await asyncio.to_thread(_write_log_lines, lines)
+        except Exception:
+            pass
+
+
+@app.on_event("startup")
+async def _raise_thread_limit() -> None:
+    # The default AnyIO pool caps asyncio.to_thread work (Gemini calls, log
+    # flushes) at 40 concurrent threads per process; raise it so one worker
+    # can keep more upstream calls in flight
+    import anyio
+
+    anyio.to_thread.current_default_thread_limiter().total_tokens = 200
+
+
+@app.on_event("startup")
+async def _start_log_writer() -> None:
+    global LOG_QUEUE
+    LOG_QUEUE = asyncio.Queue(maxsize=LOG_QUEUE_MAXSIZE)
+    _spawn_bg(_log_writer())
+
 
 def append_exchange(prompt: str, reply: str, model: str = GENIE_MODEL, streaming: bool = False) -> None:
     """
-    Append a single JSON object to a newline-delimited log file.
-    Runs synchronously; call via asyncio.to_thread when used from async code.
+    Queue a single JSON log record for the background writer. Never blocks
+    the caller on file I/O; if the queue is full the oldest record is dropped.
     """
     try:
-        LOG_DIR.mkdir(parents=True, exist_ok=True)
         record = {
-            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "timestamp": _utc_timestamp() + "Z",
             "model": model,
             "streaming": bool(streaming),
             "prompt": prompt,
             "reply": reply,
         }
-        with LOG_FILE.open("a", encoding="utf-8") as fh:
-            fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+        line = orjson.dumps(record) + b"\n"
+        if LOG_QUEUE is None:
+            # writer not running yet (import time / startup); write directly
+            with _LOG_LOCK:
+                _LOG_FH.write(line)
+            return
+        try:
+            LOG_QUEUE.put_nowait(line)
+        except asyncio.QueueFull:
+            try:
+                LOG_QUEUE.get_nowait()
+            except asyncio.QueueEmpty:
+                pass
+            try:
+                LOG_QUEUE.put_nowait(line)
+            except asyncio.QueueFull:
+                pass
     except Exception:
         # don't raise logging errors into the main flow
         pass
 
 
-async def gemini_full(prompt: str) -> str:
+# ---- In-process LRU cache for completions ----
+# Identical prompts short-circuit to a dict lookup instead of a full Gemini
+# round-trip. Keys are (model, blake2b(prompt)) so huge prompts don't bloat
+# the cache; error replies are never cached.
+REPLY_CACHE_MAX = 1024
+_REPLY_CACHE: "OrderedDict[tuple[str, bytes], str]" = OrderedDict()
+_REPLY_CACHE_LOCK = asyncio.Lock()
+
+
+def _cache_key(prompt: str) -> tuple:
+    return (GENIE_MODEL, hashlib.blake2b(prompt.encode("utf-8")).digest())
+
+
+async def _cache_get(key: tuple):
+    async with _REPLY_CACHE_LOCK:
+        if key in _REPLY_CACHE:
+            _REPLY_CACHE.move_to_end(key)
+            return _REPLY_CACHE[key]
+    return None
+
+
+async def _cache_put(key: tuple, text: str) -> None:
+    async with _REPLY_CACHE_LOCK:
+        _REPLY_CACHE[key] = text
+        _REPLY_CACHE.move_to_end(key)
+        while len(_REPLY_CACHE) > REPLY_CACHE_MAX:
+            _REPLY_CACHE.popitem(last=False)
+
+
+# ---- Semantic-similarity cache ----
+# Many prompts are paraphrases of earlier ones. On an exact-match miss we
+# embed the prompt and, if a stored prompt's embedding is close enough by
+# cosine similarity, serve its reply without calling Gemini at all.
+# Embeddings are unit-normalized so similarity is a single matrix-vector dot.
+EMBED_MODEL = os.getenv("GEMINI_EMBED_MODEL", "text-embedding-004")
+SEMANTIC_THRESHOLD = 0.92
+SEMANTIC_CACHE_MAX = 4096
+_SEM_EMB_FILE = Path(__file__).with_name("semantic_cache.npy")
+_SEM_REPLY_FILE = Path(__file__).with_name("semantic_cache.json")
+_SEM_EMBEDDINGS: list = []  # unit-norm float32 rows
+_SEM_REPLIES: list = []
+_SEM_MATRIX = None  # cached vstack of the rows; invalidated on insert
+_SEM_LOCK = threading.Lock()
+
+
+def _embed(prompt: str):
+    """Return a unit-norm embedding for prompt, or None on failure."""
+    try:
+        resp = client.models.embed_content(model=EMBED_MODEL, contents=prompt)
+        vec = np.asarray(resp.embeddings[0].values, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else None
+    except Exception:
+        return None
+
+
+def _semantic_lookup(query):
+    global _SEM_MATRIX
+    with _SEM_LOCK:
+        if not _SEM_EMBEDDINGS:
+            return None
+        # restack only after an insert, so lookup is normally just the matvec
+        if _SEM_MATRIX is None:
+            _SEM_MATRIX = np.vstack(_SEM_EMBEDDINGS)
+        scores = _SEM_MATRIX @ query
+        best = int(np.argmax(scores))
+        if scores[best] >= SEMANTIC_THRESHOLD:
+            return _SEM_REPLIES[best]
+    return None
+
+
+def _semantic_insert(embedding, reply: str) -> None:
+    global _SEM_MATRIX
+    with _SEM_LOCK:
+        _SEM_EMBEDDINGS.append(embedding)
+        _SEM_REPLIES.append(reply)
+        if len(_SEM_EMBEDDINGS) > SEMANTIC_CACHE_MAX:
+            del _SEM_EMBEDDINGS[0]
+            del _SEM_REPLIES[0]
+        _SEM_MATRIX = None
+
+
+def _load_semantic_cache() -> None:
+    try:
+        if _SEM_EMB_FILE.exists() and _SEM_REPLY_FILE.exists():
+            matrix = np.load(_SEM_EMB_FILE)
+            replies = orjson.loads(_SEM_REPLY_FILE.read_bytes())
+            if len(replies) == matrix.shape[0]:
+                _SEM_EMBEDDINGS.extend(matrix)
+                _SEM_REPLIES.extend(replies)
+    except Exception:
+        # a stale or corrupt cache just means starting cold
+        pass
+
+
+def _save_semantic_cache() -> None:
+    try:
+        with _SEM_LOCK:
+            if not _SEM_EMBEDDINGS:
+                return
+            np.save(_SEM_EMB_FILE, np.vstack(_SEM_EMBEDDINGS))
+            _SEM_REPLY_FILE.write_bytes(orjson.dumps(_SEM_REPLIES))
+    except Exception:
+        pass
+
+
+_load_semantic_cache()
+atexit.register(_save_semantic_cache)
+
+
+def _request_kwargs(prompt: str) -> dict:
+    """Build the generate_content kwargs shared by the full and streaming paths."""
+    if _CACHED_CONTENT_NAME:
+        return {
+            "model": GENIE_MODEL,
+            "contents": prompt,
+            "config": types.GenerateContentConfig(
+                cached_content=_CACHED_CONTENT_NAME
+            ),
+        }
+    # Keep the stable prefix first so Gemini's implicit caching can still
+    # match it across requests
+    contents = f"{SYSTEM_PROMPT}\n\n{prompt}" if SYSTEM_PROMPT else prompt
+    return {"model": GENIE_MODEL, "contents": contents}
+
+
+# Single-flight map: a burst of identical prompts shares one upstream call,
+# with followers awaiting the leader's future instead of issuing their own
+_INFLIGHT: dict = {}
+
+
+async def gemini_full(prompt: str, no_cache: bool = False) -> str:
     """
     Request a full (non-streaming) completion from Gemini using genai client.
+    Repeated prompts are served from an in-process LRU cache unless no_cache
+    is set, and concurrent identical prompts are coalesced into one call.
     """
-    def _call() -> str:
-        resp = client.models.generate_content(
-            model=GENIE_MODEL,
-            contents=prompt,
-        )
-        # google-genai responses expose a .text attribute
-        text = getattr(resp, "text", None)
-        if text is None:
-            text = str(resp)
+    key = _cache_key(prompt)
+    if not no_cache:
+        cached = await _cache_get(key)
+        if cached is not None:
+            return cached
+        inflight = _INFLIGHT.get(key)
+        if inflight is not None:
+            # shield: this follower disconnecting must not cancel the shared call
+            return await asyncio.shield(inflight)
+
+    async def _miss() -> str:
+        embedding = None
+        if not no_cache:
+            # Exact miss: try the semantic cache before paying for a completion
+            embedding = await asyncio.to_thread(_embed, prompt)
+            if embedding is not None:
+                near = _semantic_lookup(embedding)
+                if near is not None:
+                    # promote into the exact LRU so a literal repeat of this
+                    # prompt skips the embed round-trip next time
+                    _spawn_bg(_cache_put(key, near))
+                    return near
+
+        def _call() -> str:
+            resp = client.models.generate_content(**_request_kwargs(prompt))
+            # the google-genai SDK always exposes .text; keep the defensive
+            # fallback off the happy path
+            try:
+                return resp.text or ""
+            except AttributeError:
+                return str(resp)
+
+        # Run the synchronous call in a separate thread so we don't block the event loop
+        try:
+            text = await asyncio.to_thread(_call)
+        except Exception as e:
+            return f"[error] {e}"
+
+        # Don't poison the caches with transient failures; inserts are pure
+        # bookkeeping, so run them in the background instead of delaying the reply
+        if not text.startswith("[error]"):
+            _spawn_bg(_cache_put(key, text))
+            if embedding is not None:
+                _semantic_insert(embedding, text)
         return text
 
-    # Run the synchronous call in a separate thread so we don't block the event loop
+    if no_cache:
+        return await _miss()
+
+    # Leader: run the miss in its own task so no single requester's
+    # disconnect can cancel the call out from under the other awaiters
+    task = asyncio.create_task(_miss())
+    _INFLIGHT[key] = task
+
+    def _cleanup(t: asyncio.Task) -> None:
+        _INFLIGHT.pop(key, None)
+        if not t.cancelled():
+            # retrieve any exception so asyncio never logs it at GC
+            t.exception()
+
+    task.add_done_callback(_cleanup)
+    return await asyncio.shield(task)
+
+
+async def gemini_stream_real(prompt: str, status: dict = None) -> AsyncIterator[str]:
+    """
+    Stream a completion from Gemini chunk by chunk. The sync SDK iterator
+    runs in a worker thread and hands chunks to the event loop through a
+    queue, so the first token goes out as soon as the model emits it.
+
+    If the upstream stream fails mid-way the error text is yielded as a
+    final chunk and status["error"] is set, so callers can tell a complete
+    reply from a partial one and avoid caching the latter.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()  # sentinel
+    cancelled = threading.Event()
+
+    def _produce() -> None:
+        try:
+            stream = client.models.generate_content_stream(
+                **_request_kwargs(prompt)
+            )
+            for chunk in stream:
+                # stop pulling tokens once the consumer has gone away
+                if cancelled.is_set():
+                    break
+                text = chunk.text
+                if text:
+                    loop.call_soon_threadsafe(queue.put_nowait, text)
+        except Exception as e:
+            # pass the exception itself so the consumer can tell it apart
+            # from ordinary text chunks
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+
+    producer = asyncio.create_task(asyncio.to_thread(_produce))
     try:
-        return await asyncio.to_thread(_call)
-    except Exception as e:
-        return f"[error] {e}"
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                if status is not None:
+                    status["error"] = True
+                yield f"[error] {item}"
+                continue
+            yield item
+    finally:
+        # Runs on normal completion and on early close (client disconnect);
+        # tells the producer thread to abandon the upstream Gemini stream.
+        cancelled.set()
+        await producer
+
+
+STREAM_CHUNK_CHARS = 48
+
+
+async def _stream_text(full: str) -> AsyncIterator[str]:
+    """
+    Yield an already-complete reply (e.g. a cache hit) in slices. Slicing
+    the original string at space boundaries avoids materializing a word list
+    plus a join per chunk, and the slices concatenate back to the exact
+    reply, whitespace included.
+    """
+    pos = 0
+    length = len(full)
+    while pos < length:
+        end = pos + STREAM_CHUNK_CHARS
+        if end < length:
+            nxt = full.find(" ", end)
+            end = length if nxt == -1 else nxt + 1
+        else:
+            end = length
+        yield full[pos:end]
+        pos = end
 
 
-async def gemini_stream_sim(prompt: str) -> AsyncIterator[str]:
+SSE_FLUSH_INTERVAL = 0.02
+SSE_FLUSH_BYTES = 512
+
+
+# Pre-encoded terminal frame; Starlette passes bytes through untouched
+_SSE_DONE = b"event: done\ndata: [DONE]\n\n"
+
+
+def sse_encode(payload: str) -> bytes:
     """
-    Simple streaming implementation: get full reply and yield it in chunks.
-    Replace with true streaming API if/when available in genai.
+    Frame a payload as a spec-compliant SSE data event. Every line of a
+    multi-line payload needs its own "data:" prefix or downstream parsers
+    will mangle the event. Returns bytes so Starlette skips re-encoding.
     """
-    full = await gemini_full(prompt)
+    return ("data: " + payload.replace("\n", "\ndata: ") + "\n\n").encode("utf-8")
 
-    # If the call returned an error prefix, yield it once and finish
-    if full.startswith("[error]"):
-        yield full
-        return
 
-    # Split into small chunks to simulate streaming
-    words = full.split()
-    for i in range(0, len(words), 6):
-        chunk = " ".join(words[i: i + 6])
-        await asyncio.sleep(0.07)
-        yield chunk
+async def _coalesce_chunks(chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    """
+    Batch streamed chunks into fewer, larger SSE frames. Every yield costs an
+    ASGI send plus a socket write, so buffer chunks and flush only every
+    SSE_FLUSH_INTERVAL seconds or once SSE_FLUSH_BYTES have accumulated.
+    """
+    loop = asyncio.get_running_loop()
+    buffer = []
+    size = 0
+    last_flush = loop.time()
+    async for chunk in chunks:
+        buffer.append(chunk)
+        size += len(chunk)
+        if size > SSE_FLUSH_BYTES or loop.time() - last_flush >= SSE_FLUSH_INTERVAL:
+            yield "".join(buffer)
+            buffer.clear()
+            size = 0
+            last_flush = loop.time()
+    if buffer:
+        yield "".join(buffer)
 
 
 @app.post("/api/chat")
@@ -153,38 +611,85 @@ async def chat_endpoint(req: Request, body: ChatRequest):
     If client asks for text/event-stream via Accept header we stream SSE chunks.
     Otherwise return a single JSON reply object { "reply": "..." }.
     """
-    accept = (req.headers.get("accept") or "").lower()
+    accept = req.headers.get("accept", "")
+    # Clients almost always send the media type in lowercase; only pay for a
+    # casefolded copy when the fast substring check misses and the header
+    # actually contains uppercase
+    wants_sse = "text/event-stream" in accept or (
+        not accept.islower() and "text/event-stream" in accept.casefold()
+    )
     prompt = body.message or ""
 
+    if len(prompt) > MAX_PROMPT_CHARS:
+        return ORJSONResponse({"error": "too_long"}, status_code=413)
+
     # SSE streaming mode
-    if "text/event-stream" in accept:
-        # Get full reply first, log it, then stream chunks
-        full_reply = await gemini_full(prompt)
-        # Log exchange (run file write in thread)
-        await asyncio.to_thread(append_exchange, prompt, full_reply, GENIE_MODEL, True)
+    if wants_sse:
+        key = _cache_key(prompt)
+        cached = None if body.no_cache else await _cache_get(key)
 
         async def event_stream():
-            # Split into small chunks to simulate streaming
-            words = full_reply.split()
-            for i in range(0, len(words), 6):
-                chunk = " ".join(words[i: i + 6])
-                await asyncio.sleep(0.07)
-                yield f"data: {chunk}\n\n"
-            # final event to indicate completion
-            yield "event: done\ndata: [DONE]\n\n"
+            frames = 0
+
+            # Cache hit: replay the stored reply in chunks
+            if cached is not None:
+                append_exchange(prompt, cached, GENIE_MODEL, True)
+                async for chunk in _coalesce_chunks(_stream_text(cached)):
+                    yield sse_encode(chunk)
+                    frames += 1
+                    if frames % 8 == 0 and await req.is_disconnected():
+                        return
+                yield _SSE_DONE
+                return
+
+            # Miss: stream tokens from Gemini as they arrive, then cache/log.
+            # Breaking out of the loop closes gemini_stream_real, which in
+            # turn cancels the upstream Gemini request.
+            parts = []
+            aborted = False
+            status = {"error": False}
+            async for chunk in _coalesce_chunks(gemini_stream_real(prompt, status)):
+                parts.append(chunk)
+                yield sse_encode(chunk)
+                frames += 1
+                if frames % 8 == 0 and await req.is_disconnected():
+                    aborted = True
+                    break
+            full_reply = "".join(parts)
+            if (
+                not aborted
+                and not status["error"]
+                and full_reply
+                and not full_reply.startswith("[error]")
+            ):
+                _spawn_bg(_cache_put(key, full_reply))
+            append_exchange(prompt, full_reply, GENIE_MODEL, True)
+            if not aborted:
+                # final event to indicate completion
+                yield _SSE_DONE
 
         return StreamingResponse(event_stream(), media_type="text/event-stream")
 
     # Non-streaming JSON response
-    reply = await gemini_full(prompt)
+    reply = await gemini_full(prompt, no_cache=body.no_cache)
 
-    # ✅ Save this exchange to conversations.json
+    # Log this exchange (enqueue only; the writer task does the file I/O)
     append_exchange(prompt, reply)
 
-    return JSONResponse({"reply": reply})
+    return ORJSONResponse({"reply": reply})
 
 
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
+    # Multiple workers multiply the effective concurrent Gemini calls, and
+    # uvloop + httptools cut per-request loop/parsing overhead versus the
+    # defaults. Note workers is incompatible with reload.
+    uvicorn.run(
+        "main:app",
+        host="127.0.0.1",
+        port=8000,
+        workers=os.cpu_count(),
+        loop="uvloop",
+        http="httptools",
+    )